@@ -5,372 +5,479 @@ Writes results to output file
 """
 
 from database_setup import get_db_connection, date_int_to_string
-from config import OUTPUT_DIR, RESULTS_FILE
-import math
+from config import OUTPUT_DIR, RESULTS_FILE, ANALYSIS_CACHE_FILE
+import numpy as np
+import heapq
+import itertools
 import os
+import pickle
+from operator import itemgetter
+from typing import Any, Callable
 
+# Bump when the layout of cached intermediates changes
+ANALYSIS_CACHE_VERSION = 3
 
-def get_crypto_prices_with_symbols():
+# Positions of the leading columns shared by both price queries' rows
+DATE_COL, SYMBOL_COL, DAILY_RETURN_COL, VOLATILITY_COL, MOMENTUM_COL = range(5)
+
+# One symbol's (date, value) pairs, and those pairs keyed by symbol
+Series = list[tuple[int, float]]
+SeriesBySymbol = dict[str, Series]
+
+
+def get_crypto_prices_with_symbols(momentum_window=7):
     """
     Retrieve all crypto price data with symbol names using JOIN
+    Daily return, volatility and momentum are calculated in SQL with
+    window functions over each crypto's price history
+
+    Args:
+        momentum_window: Number of days momentum looks back
 
     Returns:
-        list: List of dict rows with date, symbol, name, price, volume
+        list: List of tuple rows (date, symbol, daily_return, volatility, momentum,
+              name, price, market_cap, volume); calculated values are None
+              until enough history exists
     """
     conn = get_db_connection()
     cur = conn.cursor()
+    cur.row_factory = None  # Plain tuples; callers index by position
 
     # SQL JOIN to combine crypto_price with crypto_symbol
+    # LAG looks back 1 and momentum_window days within each crypto
+    # Volatility = absolute daily price change as percentage of price
+    # (crypto data has no intraday high/low)
     query = """
         SELECT
-            cp.date,
-            cs.symbol,
-            cs.name,
-            cp.price_usd,
-            cp.market_cap,
-            cp.volume
-        FROM crypto_price cp
-        JOIN crypto_symbol cs ON cp.crypto_id = cs.id
-        ORDER BY cs.symbol, cp.date
+            date,
+            symbol,
+            CASE
+                WHEN prev_price > 0 THEN (price_usd - prev_price) / prev_price * 100
+                WHEN prev_price IS NOT NULL THEN 0
+            END AS daily_return,
+            CASE
+                WHEN prev_price > 0 THEN ABS(price_usd - prev_price) / prev_price * 100
+                WHEN prev_price IS NOT NULL THEN 0
+            END AS volatility,
+            CASE
+                WHEN past_price > 0 THEN (price_usd - past_price) / past_price * 100
+                WHEN past_price IS NOT NULL THEN 0
+            END AS momentum,
+            name,
+            price_usd,
+            market_cap,
+            volume
+        FROM (
+            SELECT
+                cp.date,
+                cs.symbol,
+                cs.name,
+                cp.price_usd,
+                cp.market_cap,
+                cp.volume,
+                LAG(cp.price_usd, 1) OVER w AS prev_price,
+                LAG(cp.price_usd, ?) OVER w AS past_price
+            FROM crypto_price cp
+            JOIN crypto_symbol cs ON cp.crypto_id = cs.id
+            WINDOW w AS (PARTITION BY cp.crypto_id ORDER BY cp.date)
+        )
+        ORDER BY symbol, date
     """
 
-    cur.execute(query)
-    rows = cur.fetchall()
-    conn.close()
-
-    return [dict(row) for row in rows]
+    cur.execute(query, (momentum_window,))
+    return cur.fetchall()
 
 
-def get_stock_prices_with_symbols():
+def get_stock_prices_with_symbols(momentum_window=7):
     """
     Retrieve all stock price data with symbol names using JOIN
+    Daily return, volatility and momentum are calculated in SQL with
+    window functions over each stock's price history
+
+    Args:
+        momentum_window: Number of trading days momentum looks back
 
     Returns:
-        list: List of dict rows with date, symbol, name, open, high, low, close, volume
+        list: List of tuple rows (date, symbol, daily_return, volatility, momentum,
+              name, open, high, low, close, volume); calculated values are None
+              until enough history exists
     """
     conn = get_db_connection()
     cur = conn.cursor()
+    cur.row_factory = None  # Plain tuples; callers index by position
 
     # SQL JOIN to combine stock_price with stock_symbol
+    # LAG looks back 1 and momentum_window trading days within each stock
+    # Volatility = (high - low) / close * 100
     query = """
         SELECT
-            sp.date,
-            ss.symbol,
-            ss.name,
-            sp.open,
-            sp.high,
-            sp.low,
-            sp.close,
-            sp.volume
-        FROM stock_price sp
-        JOIN stock_symbol ss ON sp.stock_id = ss.id
-        ORDER BY ss.symbol, sp.date
+            date,
+            symbol,
+            CASE
+                WHEN prev_close > 0 THEN (close - prev_close) / prev_close * 100
+                WHEN prev_close IS NOT NULL THEN 0
+            END AS daily_return,
+            CASE
+                WHEN close > 0 THEN (high - low) / close * 100
+                ELSE 0
+            END AS volatility,
+            CASE
+                WHEN past_close > 0 THEN (close - past_close) / past_close * 100
+                WHEN past_close IS NOT NULL THEN 0
+            END AS momentum,
+            name,
+            open,
+            high,
+            low,
+            close,
+            volume
+        FROM (
+            SELECT
+                sp.date,
+                ss.symbol,
+                ss.name,
+                sp.open,
+                sp.high,
+                sp.low,
+                sp.close,
+                sp.volume,
+                LAG(sp.close, 1) OVER w AS prev_close,
+                LAG(sp.close, ?) OVER w AS past_close
+            FROM stock_price sp
+            JOIN stock_symbol ss ON sp.stock_id = ss.id
+            WINDOW w AS (PARTITION BY sp.stock_id ORDER BY sp.date)
+        )
+        ORDER BY symbol, date
     """
 
-    cur.execute(query)
-    rows = cur.fetchall()
-    conn.close()
-
-    return [dict(row) for row in rows]
+    cur.execute(query, (momentum_window,))
+    return cur.fetchall()
 
 
-def calculate_crypto_volatility(crypto_data):
+def series_by_symbol(rows: list[tuple[Any, ...]], column: int) -> SeriesBySymbol:
     """
-    Calculate daily volatility for cryptocurrencies
-    Volatility = price range as percentage of price
+    Split one calculated column into per-symbol (date, value) lists
+    Rows where the value is missing (not enough history yet) are left out
 
     Args:
-        crypto_data: List of crypto price records
+        rows: Price records ordered by symbol, then date (as returned by the
+              get_*_prices_with_symbols queries); grouping relies on this order
+        column: Position of the calculated column (e.g., DAILY_RETURN_COL)
 
     Returns:
-        dict: {symbol: [(date, volatility), ...]}
+        dict: {symbol: [(date, value), ...]}
     """
-    # Group by symbol
-    by_symbol = {}
-    for row in crypto_data:
-        symbol = row['symbol']
-        if symbol not in by_symbol:
-            by_symbol[symbol] = []
-        by_symbol[symbol].append(row)
-
-    volatility_data = {}
-
-    for symbol, prices in by_symbol.items():
-        volatilities = []
+    series: SeriesBySymbol = {}
+    for symbol, group in itertools.groupby(rows, key=itemgetter(SYMBOL_COL)):
+        series[symbol] = [(row[DATE_COL], row[column]) for row in group if row[column] is not None]
 
-        for i in range(1, len(prices)):
-            # For crypto, estimate high/low from price variations
-            # Use 2% range as estimate (crypto typically has intraday volatility)
-            current_price = prices[i]['price_usd']
-            prev_price = prices[i-1]['price_usd']
+    return series
 
-            # Estimate volatility from price change
-            price_change = abs(current_price - prev_price)
-            volatility = (price_change / prev_price) * 100 if prev_price > 0 else 0
 
-            volatilities.append((prices[i]['date'], volatility))
-
-        volatility_data[symbol] = volatilities
-
-    return volatility_data
-
-
-def calculate_stock_volatility(stock_data):
+def normalize_series(series: Series) -> tuple[np.ndarray, np.ndarray]:
     """
-    Calculate daily volatility for stocks
-    Volatility = (high - low) / close * 100
+    Convert a (date, value) series to arrays, mean-centered and scaled to
+    unit length (Pearson correlation is unaffected by either)
 
     Args:
-        stock_data: List of stock price records
+        series: List of (date, value) tuples, ordered by date
 
     Returns:
-        dict: {symbol: [(date, volatility), ...]}
+        tuple: (dates, values) NumPy arrays (int32 dates, float64 values)
     """
-    # Group by symbol
-    by_symbol = {}
-    for row in stock_data:
-        symbol = row['symbol']
-        if symbol not in by_symbol:
-            by_symbol[symbol] = []
-        by_symbol[symbol].append(row)
-
-    volatility_data = {}
-
-    for symbol, prices in by_symbol.items():
-        volatilities = []
+    pairs = np.asarray(series, dtype=np.float64).reshape(-1, 2)
+    dates = pairs[:, 0].astype(np.int32)
+    values = pairs[:, 1] - pairs[:, 1].mean() if len(pairs) else pairs[:, 1]
 
-        for price in prices:
-            high = price['high']
-            low = price['low']
-            close = price['close']
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values = values / norm
 
-            volatility = ((high - low) / close * 100) if close > 0 else 0
-            volatilities.append((price['date'], volatility))
+    return dates, values
 
-        volatility_data[symbol] = volatilities
 
-    return volatility_data
-
-
-def calculate_price_momentum(data, symbol_key='symbol', price_key='price_usd', window=7):
+def _align_on_dates(normalized: list[tuple[np.ndarray, np.ndarray]],
+                    all_dates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
     """
-    Calculate price momentum over a time window
-    Momentum = (price_today - price_N_days_ago) / price_N_days_ago * 100
+    Place normalized series on a shared, sorted date grid
 
     Args:
-        data: List of price records
-        symbol_key: Key name for symbol in data
-        price_key: Key name for price in data
-        window: Number of days to look back
+        normalized: List of (dates, values) array pairs from normalize_series
+        all_dates: Sorted NumPy array of every date in any series
 
     Returns:
-        dict: {symbol: [(date, momentum), ...]}
+        tuple: (values, mask) 2D arrays, one row per series;
+               dates a series doesn't have are 0 in both
     """
-    # Group by symbol
-    by_symbol = {}
-    for row in data:
-        symbol = row[symbol_key]
-        if symbol not in by_symbol:
-            by_symbol[symbol] = []
-        by_symbol[symbol].append(row)
+    values = np.zeros((len(normalized), len(all_dates)))
+    mask = np.zeros((len(normalized), len(all_dates)))
 
-    momentum_data = {}
+    for row, (dates, series_values) in enumerate(normalized):
+        columns = np.searchsorted(all_dates, dates)
+        values[row, columns] = series_values
+        mask[row, columns] = 1.0
 
-    for symbol, prices in by_symbol.items():
-        momentums = []
+    return values, mask
 
-        for i in range(window, len(prices)):
-            current_price = prices[i][price_key]
-            past_price = prices[i - window][price_key]
 
-            if past_price > 0:
-                momentum = ((current_price - past_price) / past_price) * 100
-            else:
-                momentum = 0
+def calculate_correlation_matrix(series_a: SeriesBySymbol,
+                                 series_b: SeriesBySymbol) -> dict[tuple[str, str], float]:
+    """
+    Calculate Pearson correlation coefficients between every pair of series
+    Each pair is compared over the dates both series have in common
 
-            momentums.append((prices[i]['date'], momentum))
+    Every series is normalized once, and every pairwise sum is computed for
+    all pairs at once with a matrix product, so no work is
+    repeated per pair
 
-        momentum_data[symbol] = momentums
+    Args:
+        series_a: Dict of {symbol: [(date, value), ...]}
+        series_b: Dict of {symbol: [(date, value), ...]}
 
-    return momentum_data
+    Returns:
+        dict: {(symbol_a, symbol_b): correlation (-1 to 1), or 0 if can't calculate}
+    """
+    if not series_a or not series_b:
+        return {}
+
+    normalized_a = {symbol: normalize_series(series) for symbol, series in series_a.items()}
+    normalized_b = {symbol: normalize_series(series) for symbol, series in series_b.items()}
+
+    # One sorted date grid shared by every series
+    all_dates = np.unique(np.concatenate(
+        [dates for dates, _ in normalized_a.values()] +
+        [dates for dates, _ in normalized_b.values()]
+    ))
+
+    a, mask_a = _align_on_dates(list(normalized_a.values()), all_dates)
+    b, mask_b = _align_on_dates(list(normalized_b.values()), all_dates)
+
+    # Sums over the common dates of each pair (masks zero out the rest)
+    n = mask_a @ mask_b.T
+    sum_a = a @ mask_b.T
+    sum_b = mask_a @ b.T
+    sum_ab = a @ b.T
+    sum_aa = (a * a) @ mask_b.T
+    sum_bb = mask_a @ (b * b).T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = sum_ab - sum_a * sum_b / n
+        var_a = sum_aa - sum_a * sum_a / n
+        var_b = sum_bb - sum_b * sum_b / n
+        corr_matrix = covariance / np.sqrt(var_a * var_b)
+
+    # A variance at rounding level relative to its sum of squares means the
+    # values are constant over the common dates, however few there are
+    invalid = ((n < 2) | (var_a <= 1e-12 * sum_aa) | (var_b <= 1e-12 * sum_bb)
+               | ~np.isfinite(corr_matrix))
+    corr_matrix[invalid] = 0.0
+
+    return {
+        (symbol_a, symbol_b): float(corr_matrix[i, j])
+        for i, symbol_a in enumerate(series_a)
+        for j, symbol_b in enumerate(series_b)
+    }
 
 
-def calculate_daily_returns(data, symbol_key='symbol', price_key='price_usd'):
+def calculate_average_volatility(volatility_data: SeriesBySymbol) -> dict[str, float]:
     """
-    Calculate daily percentage returns
+    Calculate average volatility for each symbol
 
     Args:
-        data: List of price records
-        symbol_key: Key for symbol
-        price_key: Key for price
+        volatility_data: Dict of {symbol: [(date, volatility), ...]}
 
     Returns:
-        dict: {symbol: [(date, return_pct), ...]}
+        dict: {symbol: avg_volatility}
     """
-    by_symbol = {}
-    for row in data:
-        symbol = row[symbol_key]
-        if symbol not in by_symbol:
-            by_symbol[symbol] = []
-        by_symbol[symbol].append(row)
-
-    returns_data = {}
+    averages: dict[str, float] = {}
+    for symbol, data in volatility_data.items():
+        if data:
+            avg = sum(vol for _, vol in data) / len(data)
+            averages[symbol] = avg
+        else:
+            averages[symbol] = 0.0
+    return averages
 
-    for symbol, prices in by_symbol.items():
-        returns = []
 
-        for i in range(1, len(prices)):
-            current_price = prices[i][price_key]
-            prev_price = prices[i-1][price_key]
+def find_top_momentum_days(momentum_data: SeriesBySymbol, top_n: int = 5) -> SeriesBySymbol:
+    """
+    Find days with highest absolute momentum for each symbol
 
-            if prev_price > 0:
-                daily_return = ((current_price - prev_price) / prev_price) * 100
-            else:
-                daily_return = 0
+    Args:
+        momentum_data: Dict of {symbol: [(date, momentum), ...]}
+        top_n: Number of top days to return
 
-            returns.append((prices[i]['date'], daily_return))
+    Returns:
+        dict: {symbol: [(date, momentum), ...]}
+    """
+    top_days: SeriesBySymbol = {}
+    for symbol, data in momentum_data.items():
+        # Largest absolute momentum values (no need to sort the whole list)
+        top_days[symbol] = heapq.nlargest(top_n, data, key=lambda x: abs(x[1]))
+    return top_days
 
-        returns_data[symbol] = returns
 
-    return returns_data
+def get_data_fingerprints():
+    """
+    Get a fingerprint for each price table that changes whenever its rows do
+    Row count and MAX(rowid) alone would match a rebuilt table of the same
+    size, so sums over the dates, symbol IDs and prices are included too
 
+    Returns:
+        dict: {table: (max_rowid, row_count, date_sum, id_date_sum, price_total)}
+              for crypto_price and stock_price
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
 
-def calculate_correlation(series1, series2):
+    fingerprints = {}
+    for table, id_column, price_column in (('crypto_price', 'crypto_id', 'price_usd'),
+                                           ('stock_price', 'stock_id', 'close')):
+        cur.execute(f"""
+            SELECT
+                MAX(rowid) AS max_rowid,
+                COUNT(*) AS row_count,
+                TOTAL(date) AS date_sum,
+                TOTAL({id_column} * date) AS id_date_sum,
+                TOTAL({price_column}) AS price_total
+            FROM {table}
+        """)
+        row = cur.fetchone()
+        fingerprints[table] = (row['max_rowid'], row['row_count'], row['date_sum'],
+                               row['id_date_sum'], row['price_total'])
+
+    return fingerprints
+
+
+def load_analysis_cache(filename=None):
     """
-    Calculate Pearson correlation coefficient between two series
+    Load cached analysis intermediates from disk
 
     Args:
-        series1: List of (date, value) tuples
-        series2: List of (date, value) tuples
+        filename: Cache filename (defaults to config.ANALYSIS_CACHE_FILE)
 
     Returns:
-        float: Correlation coefficient (-1 to 1), or 0 if can't calculate
+        dict: Cached intermediates, or an empty cache if missing/unreadable/outdated
     """
-    # Create dictionaries for easy matching by date
-    dict1 = {date: value for date, value in series1}
-    dict2 = {date: value for date, value in series2}
-
-    # Find common dates
-    common_dates = sorted(set(dict1.keys()) & set(dict2.keys()))
-
-    if len(common_dates) < 2:
-        return 0.0
-
-    # Get aligned values
-    values1 = [dict1[date] for date in common_dates]
-    values2 = [dict2[date] for date in common_dates]
+    if filename is None:
+        filename = ANALYSIS_CACHE_FILE
 
-    # Calculate means
-    mean1 = sum(values1) / len(values1)
-    mean2 = sum(values2) / len(values2)
+    try:
+        with open(filename, 'rb') as f:
+            cache = pickle.load(f)
+    except Exception:
+        cache = None
 
-    # Calculate correlation
-    numerator = sum((v1 - mean1) * (v2 - mean2) for v1, v2 in zip(values1, values2))
+    if not isinstance(cache, dict) or cache.get('version') != ANALYSIS_CACHE_VERSION:
+        cache = {'version': ANALYSIS_CACHE_VERSION}
+    return cache
 
-    sum_sq1 = sum((v1 - mean1) ** 2 for v1 in values1)
-    sum_sq2 = sum((v2 - mean2) ** 2 for v2 in values2)
 
-    denominator = math.sqrt(sum_sq1 * sum_sq2)
+def save_analysis_cache(cache, filename=None):
+    """
+    Save analysis intermediates to disk
 
-    if denominator == 0:
-        return 0.0
+    Args:
+        cache: Dictionary of cached intermediates
+        filename: Cache filename (defaults to config.ANALYSIS_CACHE_FILE)
+    """
+    if filename is None:
+        filename = ANALYSIS_CACHE_FILE
 
-    return numerator / denominator
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'wb') as f:
+        pickle.dump(cache, f)
 
 
-def calculate_average_volatility(volatility_data):
+def get_table_series(cache: dict[str, Any], table: str, fingerprint: tuple[Any, ...],
+                     fetch_rows: Callable[..., list[tuple[Any, ...]]], label: str) -> dict[str, Any]:
     """
-    Calculate average volatility for each symbol
+    Get per-symbol volatility, momentum and returns for one price table
+    Reuses the cached copy when the table hasn't changed since it was calculated
 
     Args:
-        volatility_data: Dict of {symbol: [(date, volatility), ...]}
+        cache: Analysis cache (updated in place on a miss)
+        table: Price table name (e.g., 'crypto_price')
+        fingerprint: Current fingerprint of the table from get_data_fingerprints()
+        fetch_rows: Function that fetches the table's rows with calculated columns
+        label: Name for log messages (e.g., 'crypto')
 
     Returns:
-        dict: {symbol: avg_volatility}
+        dict: {'key', 'rows', 'volatility', 'momentum', 'returns'}
     """
-    averages = {}
-    for symbol, data in volatility_data.items():
-        if data:
-            avg = sum(vol for _, vol in data) / len(data)
-            averages[symbol] = avg
-        else:
-            averages[symbol] = 0.0
-    return averages
+    cached = cache.get(table)
+    if cached and cached['key'] == fingerprint:
+        print(f"Using cached results for {cached['rows']} {label} price records")
+        return cached
 
+    # Volatility, 7-day momentum and daily returns are calculated in SQL
+    rows = fetch_rows(momentum_window=7)
+    print(f"Loaded {len(rows)} {label} price records")
 
-def find_top_momentum_days(momentum_data, top_n=5):
-    """
-    Find days with highest absolute momentum for each symbol
+    entry: dict[str, Any] = {'key': fingerprint, 'rows': len(rows),
+             'volatility': {}, 'momentum': {}, 'returns': {}}
+    if rows:
+        # Split the SQL-calculated columns by symbol
+        entry['volatility'] = series_by_symbol(rows, VOLATILITY_COL)
+        entry['momentum'] = series_by_symbol(rows, MOMENTUM_COL)
+        entry['returns'] = series_by_symbol(rows, DAILY_RETURN_COL)
 
-    Args:
-        momentum_data: Dict of {symbol: [(date, momentum), ...]}
-        top_n: Number of top days to return
-
-    Returns:
-        dict: {symbol: [(date, momentum), ...]}
-    """
-    top_days = {}
-    for symbol, data in momentum_data.items():
-        # Sort by absolute momentum value
-        sorted_data = sorted(data, key=lambda x: abs(x[1]), reverse=True)
-        top_days[symbol] = sorted_data[:top_n]
-    return top_days
+    cache[table] = entry
+    return entry
 
 
 def perform_analysis():
     """
     Main analysis function
     Performs all calculations and returns results
+    Intermediates are cached on disk and only recalculated for price tables
+    that have new rows since the last run
     """
     print("=" * 60)
     print("Performing Data Analysis")
     print("=" * 60)
 
+    fingerprints = get_data_fingerprints()
+    cache = load_analysis_cache()
+    cached_keys = {table: entry['key'] for table, entry in cache.items() if isinstance(entry, dict)}
+
     # Fetch data from database using JOIN
     print("\nFetching data from database (using JOIN)...")
-    crypto_data = get_crypto_prices_with_symbols()
-    stock_data = get_stock_prices_with_symbols()
+    crypto = get_table_series(cache, 'crypto_price', fingerprints['crypto_price'],
+                              get_crypto_prices_with_symbols, 'crypto')
+    stock = get_table_series(cache, 'stock_price', fingerprints['stock_price'],
+                             get_stock_prices_with_symbols, 'stock')
 
-    print(f"Loaded {len(crypto_data)} crypto price records")
-    print(f"Loaded {len(stock_data)} stock price records")
-
-    if not crypto_data or not stock_data:
+    if not crypto['rows'] or not stock['rows']:
         print("\nError: Not enough data in database!")
         print("Run collect_crypto_data.py and collect_stock_data.py first.")
         return None
 
-    # Calculate volatilities
-    print("\nCalculating volatilities...")
-    crypto_volatility = calculate_crypto_volatility(crypto_data)
-    stock_volatility = calculate_stock_volatility(stock_data)
-
-    # Calculate momentum
-    print("Calculating 7-day momentum...")
-    crypto_momentum = calculate_price_momentum(crypto_data, 'symbol', 'price_usd', 7)
-    stock_momentum = calculate_price_momentum(stock_data, 'symbol', 'close', 7)
-
-    # Calculate daily returns
-    print("Calculating daily returns...")
-    crypto_returns = calculate_daily_returns(crypto_data, 'symbol', 'price_usd')
-    stock_returns = calculate_daily_returns(stock_data, 'symbol', 'close')
+    crypto_returns = crypto['returns']
+    stock_returns = stock['returns']
 
     # Calculate correlations between cryptos and stocks
-    print("Calculating cross-market correlations...")
-    correlations = {}
+    correlation_key = (fingerprints['crypto_price'], fingerprints['stock_price'])
+    cached_correlations = cache.get('correlations')
+    if cached_correlations and cached_correlations['key'] == correlation_key:
+        correlations = cached_correlations['values']
+    else:
+        print("Calculating cross-market correlations...")
+        correlations = calculate_correlation_matrix(crypto_returns, stock_returns)
+        cache['correlations'] = {'key': correlation_key, 'values': correlations}
 
-    for crypto_symbol, crypto_ret in crypto_returns.items():
-        for stock_symbol, stock_ret in stock_returns.items():
-            pair = f"{crypto_symbol}-{stock_symbol}"
-            corr = calculate_correlation(crypto_ret, stock_ret)
-            correlations[pair] = corr
+    # Only write the cache back when something was recalculated
+    new_keys = {table: entry['key'] for table, entry in cache.items() if isinstance(entry, dict)}
+    if new_keys != cached_keys:
+        save_analysis_cache(cache)
 
     # Calculate average volatilities
-    avg_crypto_vol = calculate_average_volatility(crypto_volatility)
-    avg_stock_vol = calculate_average_volatility(stock_volatility)
+    avg_crypto_vol = calculate_average_volatility(crypto['volatility'])
+    avg_stock_vol = calculate_average_volatility(stock['volatility'])
 
     # Find top momentum days
-    top_crypto_momentum = find_top_momentum_days(crypto_momentum, 5)
-    top_stock_momentum = find_top_momentum_days(stock_momentum, 5)
+    top_crypto_momentum = find_top_momentum_days(crypto['momentum'], 5)
+    top_stock_momentum = find_top_momentum_days(stock['momentum'], 5)
 
     results = {
         'correlations': correlations,
@@ -400,62 +507,68 @@ def write_results_to_file(results, filename=None):
     # Create output directory if it doesn't exist
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+    # Build the whole report in memory and write it in one call
+    parts = []
+
+    parts.append("=" * 70 + "\n")
+    parts.append("CRYPTOCURRENCY & TECH STOCK ANALYSIS RESULTS\n")
+    parts.append("=" * 70 + "\n\n")
+
+    # Cross-market correlations
+    parts.append("CROSS-MARKET CORRELATIONS\n")
+    parts.append("-" * 70 + "\n")
+    parts.append("Correlation between cryptocurrency and stock daily returns:\n\n")
+
+    correlations = results['correlations']
+    for (crypto, stock), corr in sorted(correlations.items()):
+        pair = f"{crypto}-{stock}"
+        parts.append(f"  {pair:20s}: {corr:7.4f}\n")
+
+    parts.append("\nInterpretation:\n")
+    parts.append("  1.0 = Perfect positive correlation\n")
+    parts.append("  0.0 = No correlation\n")
+    parts.append(" -1.0 = Perfect negative correlation\n")
+
+    # Average volatility
+    parts.append("\n" + "=" * 70 + "\n")
+    parts.append("AVERAGE VOLATILITY RANKINGS\n")
+    parts.append("-" * 70 + "\n\n")
+
+    parts.append("Cryptocurrencies:\n")
+    for symbol, vol in sorted(results['avg_crypto_volatility'].items(),
+                               key=lambda x: x[1], reverse=True):
+        parts.append(f"  {symbol:5s}: {vol:6.2f}% average daily volatility\n")
+
+    parts.append("\nStocks:\n")
+    for symbol, vol in sorted(results['avg_stock_volatility'].items(),
+                               key=lambda x: x[1], reverse=True):
+        parts.append(f"  {symbol:5s}: {vol:6.2f}% average daily volatility\n")
+
+    # Top momentum days
+    parts.append("\n" + "=" * 70 + "\n")
+    parts.append("TOP 5 MOMENTUM DAYS (7-Day Price Change)\n")
+    parts.append("-" * 70 + "\n\n")
+
+    parts.append("Cryptocurrencies:\n")
+    for symbol, days in results['top_crypto_momentum'].items():
+        parts.append(f"\n  {symbol}:\n")
+        for date, momentum in days:
+            date_str = date_int_to_string(date)
+            parts.append(f"    {date_str}: {momentum:+7.2f}%\n")
+
+    parts.append("\nStocks:\n")
+    for symbol, days in results['top_stock_momentum'].items():
+        parts.append(f"\n  {symbol}:\n")
+        for date, momentum in days:
+            date_str = date_int_to_string(date)
+            parts.append(f"    {date_str}: {momentum:+7.2f}%\n")
+
+    parts.append("\n" + "=" * 70 + "\n")
+    parts.append("Analysis complete. All data calculated from database SELECT queries.\n")
+    parts.append("=" * 70 + "\n")
+
     with open(filename, 'w') as f:
-        f.write("=" * 70 + "\n")
-        f.write("CRYPTOCURRENCY & TECH STOCK ANALYSIS RESULTS\n")
-        f.write("=" * 70 + "\n\n")
-
-        # Cross-market correlations
-        f.write("CROSS-MARKET CORRELATIONS\n")
-        f.write("-" * 70 + "\n")
-        f.write("Correlation between cryptocurrency and stock daily returns:\n\n")
-
-        correlations = results['correlations']
-        for pair, corr in sorted(correlations.items()):
-            f.write(f"  {pair:20s}: {corr:7.4f}\n")
-
-        f.write("\nInterpretation:\n")
-        f.write("  1.0 = Perfect positive correlation\n")
-        f.write("  0.0 = No correlation\n")
-        f.write(" -1.0 = Perfect negative correlation\n")
-
-        # Average volatility
-        f.write("\n" + "=" * 70 + "\n")
-        f.write("AVERAGE VOLATILITY RANKINGS\n")
-        f.write("-" * 70 + "\n\n")
-
-        f.write("Cryptocurrencies:\n")
-        for symbol, vol in sorted(results['avg_crypto_volatility'].items(),
-                                   key=lambda x: x[1], reverse=True):
-            f.write(f"  {symbol:5s}: {vol:6.2f}% average daily volatility\n")
-
-        f.write("\nStocks:\n")
-        for symbol, vol in sorted(results['avg_stock_volatility'].items(),
-                                   key=lambda x: x[1], reverse=True):
-            f.write(f"  {symbol:5s}: {vol:6.2f}% average daily volatility\n")
-
-        # Top momentum days
-        f.write("\n" + "=" * 70 + "\n")
-        f.write("TOP 5 MOMENTUM DAYS (7-Day Price Change)\n")
-        f.write("-" * 70 + "\n\n")
-
-        f.write("Cryptocurrencies:\n")
-        for symbol, days in results['top_crypto_momentum'].items():
-            f.write(f"\n  {symbol}:\n")
-            for date, momentum in days:
-                date_str = date_int_to_string(date)
-                f.write(f"    {date_str}: {momentum:+7.2f}%\n")
-
-        f.write("\nStocks:\n")
-        for symbol, days in results['top_stock_momentum'].items():
-            f.write(f"\n  {symbol}:\n")
-            for date, momentum in days:
-                date_str = date_int_to_string(date)
-                f.write(f"    {date_str}: {momentum:+7.2f}%\n")
-
-        f.write("\n" + "=" * 70 + "\n")
-        f.write("Analysis complete. All data calculated from database SELECT queries.\n")
-        f.write("=" * 70 + "\n")
+        f.write(''.join(parts))
 
     print(f"\nResults written to: {filename}")
 
@@ -0,0 +1,30 @@
+"""
+Optional Build Script
+Compiles analyze_data.py into a C extension with mypyc for faster analysis
+
+Usage:
+    pip install mypy
+    python build.py
+
+The compiled module (analyze_data.*.so, or .pyd on Windows) is imported
+instead of analyze_data.py whenever it is present. Rebuild after editing
+analyze_data.py, or delete the compiled file to go back to pure Python.
+
+mypyc only speeds up code it has types for, so the series and calculation
+helpers in analyze_data.py are annotated. The build type-checks them (and the
+modules they import), so keep the annotations accurate when editing.
+"""
+
+import sys
+from setuptools import setup
+from mypyc.build import mypycify
+
+if __name__ == "__main__":
+    # Default to building the extension next to the source file
+    if len(sys.argv) == 1:
+        sys.argv += ['build_ext', '--inplace']
+
+    setup(
+        name='crypto_stock_analysis',
+        ext_modules=mypycify(['analyze_data.py']),
+    )
@@ -4,17 +4,19 @@ Fetches historical price data from CoinGecko API
 Stores data in database with 25-row limit per run
 """
 
+import numpy as np
 import requests
+import threading
 import time
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from database_setup import (
     get_db_connection,
     get_crypto_id,
     get_last_crypto_date,
     get_crypto_row_count,
-    check_crypto_data_exists,
-    initialize_database,
-    date_string_to_int
+    initialize_database
 )
 from config import COINGECKO_BASE_URL, CRYPTO_SYMBOLS, MAX_ROWS_PER_RUN
 
@@ -24,6 +26,42 @@ BASE_URL = COINGECKO_BASE_URL
 # Cryptocurrency configurations (from config)
 CRYPTO_CONFIGS = {symbol: info['coingecko_id'] for symbol, info in CRYPTO_SYMBOLS.items()}
 
+# Maximum number of CoinGecko requests in flight at once
+MAX_CONCURRENT_REQUESTS = 3
+
+# The free tier allows roughly 30 calls per minute, so requests start at
+# least this many seconds apart (retries only cover short, transient errors)
+MIN_REQUEST_INTERVAL = 60 / 30
+
+# Earliest time the next request may start, shared by every thread
+_rate_limit_lock = threading.Lock()
+_next_request_time = 0.0
+
+# Shared HTTP session: keeps connections alive between coins (no new TLS
+# handshake per request) and retries rate-limit/server errors with backoff
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_maxsize=MAX_CONCURRENT_REQUESTS,
+    max_retries=Retry(total=3, status_forcelist=[429, 500, 502, 503, 504], backoff_factor=0.5)
+))
+
+
+def wait_for_rate_limit():
+    """
+    Block until the next CoinGecko request may start
+    Each caller reserves the next free slot, so concurrent requests are
+    spaced MIN_REQUEST_INTERVAL apart instead of starting together
+    """
+    global _next_request_time
+
+    with _rate_limit_lock:
+        now = time.monotonic()
+        wait = _next_request_time - now
+        _next_request_time = max(now, _next_request_time) + MIN_REQUEST_INTERVAL
+
+    if wait > 0:
+        time.sleep(wait)
+
 
 def fetch_crypto_history(coin_id, days=90):
     """
@@ -44,8 +82,10 @@ def fetch_crypto_history(coin_id, days=90):
         'interval': 'daily'
     }
 
+    wait_for_rate_limit()
+
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = SESSION.get(url, params=params, timeout=10)
         response.raise_for_status()  # Raise error for bad status codes
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -53,13 +93,51 @@ def fetch_crypto_history(coin_id, days=90):
         return None
 
 
-def parse_crypto_data(data, crypto_symbol):
+def fetch_all_crypto_history(coin_ids, days=90, max_workers=MAX_CONCURRENT_REQUESTS):
+    """
+    Fetch historical price data for several coins concurrently
+    Requests still start MIN_REQUEST_INTERVAL apart, but their round trips overlap
+
+    Args:
+        coin_ids: List of CoinGecko coin identifiers
+        days: Number of days of history to fetch
+        max_workers: Maximum number of requests in flight at once
+
+    Returns:
+        dict: {coin_id: JSON response, or None if that request failed}
+    """
+    if not coin_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = executor.map(lambda coin_id: fetch_crypto_history(coin_id, days), coin_ids)
+        return dict(zip(coin_ids, responses))
+
+
+def _epoch_ms_to_date_int(timestamp_ms):
+    """
+    Convert a millisecond Unix timestamp to an integer date in local time
+    Builds the integer from the time fields directly (no datetime object
+    and no intermediate date string)
+
+    Args:
+        timestamp_ms: Unix timestamp in milliseconds
+
+    Returns:
+        int: Date as integer (e.g., 20251215)
+    """
+    local = time.localtime(timestamp_ms / 1000)
+    return local.tm_year * 10000 + local.tm_mon * 100 + local.tm_mday
+
+
+def parse_crypto_data(data, crypto_symbol, crypto_id=None):
     """
     Parse CoinGecko API response into list of daily records
 
     Args:
         data: JSON response from CoinGecko
         crypto_symbol: Crypto ticker (e.g., 'BTC')
+        crypto_id: Integer ID of the crypto (looked up from crypto_symbol if omitted)
 
     Returns:
         list: List of tuples (date, crypto_id, price, market_cap, volume)
@@ -67,34 +145,31 @@ def parse_crypto_data(data, crypto_symbol):
     if not data or 'prices' not in data:
         return []
 
-    crypto_id = get_crypto_id(crypto_symbol)
+    if crypto_id is None:
+        crypto_id = get_crypto_id(crypto_symbol)
     if crypto_id is None:
         print(f"Error: Crypto symbol {crypto_symbol} not found in database")
         return []
 
-    records = []
-    prices = data['prices']
-    market_caps = data.get('market_caps', [])
-    volumes = data.get('total_volumes', [])
+    # Each list holds [timestamp_ms, value] pairs; load them as (n, 2) arrays
+    # (null values become NaN, which SQLite stores as NULL)
+    prices = np.asarray(data['prices'], dtype=np.float64).reshape(-1, 2)
+    market_caps = np.asarray(data.get('market_caps', []), dtype=np.float64).reshape(-1, 2)
+    volumes = np.asarray(data.get('total_volumes', []), dtype=np.float64).reshape(-1, 2)
 
     # Ensure all lists have same length
-    min_length = min(len(prices), len(market_caps), len(volumes))
+    n = min(len(prices), len(market_caps), len(volumes))
 
-    for i in range(min_length):
-        # Convert timestamp to date string
-        timestamp_ms = prices[i][0]
-        date_string = datetime.fromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d')
+    # Convert timestamps straight to integer dates
+    dates = [_epoch_ms_to_date_int(timestamp_ms) for timestamp_ms in prices[:n, 0].tolist()]
 
-        # Convert date string to integer to avoid duplicate strings
-        date_int = date_string_to_int(date_string)
-
-        price = prices[i][1]
-        market_cap = market_caps[i][1] if i < len(market_caps) else None
-        volume = volumes[i][1] if i < len(volumes) else None
-
-        records.append((date_int, crypto_id, price, market_cap, volume))
-
-    return records
+    return list(zip(
+        dates,
+        [crypto_id] * n,
+        prices[:n, 1].tolist(),
+        market_caps[:n, 1].tolist(),
+        volumes[:n, 1].tolist()
+    ))
 
 
 def insert_crypto_data(records, crypto_symbol, max_rows=MAX_ROWS_PER_RUN):
@@ -113,33 +188,52 @@ def insert_crypto_data(records, crypto_symbol, max_rows=MAX_ROWS_PER_RUN):
     conn = get_db_connection()
     cur = conn.cursor()
 
+    # Take the write lock once: the duplicate lookup and the insert run in
+    # one transaction with a single commit at the end
+    cur.execute("BEGIN IMMEDIATE")
+
     inserted_count = 0
     skipped_count = 0
 
-    for record in records:
-        date, crypto_id, price, market_cap, volume = record
-
-        # Check if already exists (avoid duplicates)
-        if check_crypto_data_exists(crypto_id, date):
-            skipped_count += 1
-            continue
+    try:
+        # Fetch every date already stored for these cryptos in one query
+        crypto_ids = sorted({record[1] for record in records})
+        placeholders = ', '.join('?' * len(crypto_ids))
+        cur.execute(f"""
+            SELECT date, crypto_id
+            FROM crypto_price
+            WHERE crypto_id IN ({placeholders})
+        """, crypto_ids)
+        existing = {(row['date'], row['crypto_id']) for row in cur.fetchall()}
+
+        # Drop duplicates (already stored, or repeated within this batch)
+        new_records = []
+        for record in records:
+            key = (record[0], record[1])
+            if key in existing:
+                continue
+            existing.add(key)
+            new_records.append(record)
+
+        skipped_count = len(records) - len(new_records)
 
         # Check if we've reached the limit for this run
-        if inserted_count >= max_rows:
+        if len(new_records) > max_rows:
             print(f"Reached limit of {MAX_ROWS_PER_RUN} rows for this run")
-            break
+        new_records = new_records[:max_rows]
 
-        try:
-            cur.execute("""
-                INSERT INTO crypto_price (date, crypto_id, price_usd, market_cap, volume)
+        if new_records:
+            cur.executemany("""
+                INSERT OR IGNORE INTO crypto_price (date, crypto_id, price_usd, market_cap, volume)
                 VALUES (?, ?, ?, ?, ?)
-            """, (date, crypto_id, price, market_cap, volume))
-            inserted_count += 1
-        except Exception as e:
-            print(f"Error inserting data for {crypto_symbol} on {date}: {e}")
+            """, new_records)
+            inserted_count = cur.rowcount
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        inserted_count = 0
+        print(f"Error inserting data for {crypto_symbol}: {e}")
 
     print(f"{crypto_symbol}: Inserted {inserted_count} rows, Skipped {skipped_count} duplicates")
     return inserted_count
@@ -174,7 +268,7 @@ def collect_crypto_data():
             print(f"  Skipping - already inserted {MAX_ROWS_PER_RUN} rows this run")
             continue
 
-        # Fetch data from API
+        # Fetch only while quota remains: one coin usually fills the whole run
         print(f"  Fetching data from CoinGecko API...")
         data = fetch_crypto_history(coin_id, days=180)
 
@@ -183,7 +277,7 @@ def collect_crypto_data():
             continue
 
         # Parse the data
-        records = parse_crypto_data(data, symbol)
+        records = parse_crypto_data(data, symbol, crypto_id)
         print(f"  Retrieved {len(records)} records from API")
 
         if not records:
@@ -197,9 +291,6 @@ def collect_crypto_data():
         inserted = insert_crypto_data(records, symbol, remaining_quota)
         total_inserted += inserted
 
-        # Rate limiting - be nice to the API
-        time.sleep(1.5)
-
         # Stop if we've reached the limit
         if total_inserted >= MAX_ROWS_PER_RUN:
             print(f"\nReached total limit of {MAX_ROWS_PER_RUN} rows for this run")
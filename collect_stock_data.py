@@ -4,14 +4,16 @@ Fetches historical stock data from Alpha Vantage API
 Stores data in database with 25-row limit per run
 """
 
+import numpy as np
 import requests
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from database_setup import (
     get_db_connection,
     get_stock_id,
     get_last_stock_date,
     get_stock_row_count,
-    check_stock_data_exists,
     create_tables,
     date_string_to_int
 )
@@ -26,6 +28,16 @@ from config import (
 API_KEY = ALPHA_VANTAGE_API_KEY
 BASE_URL = ALPHA_VANTAGE_BASE_URL
 
+# Daily fields in the order they are stored (open, high, low, close, volume)
+STOCK_FIELDS = ['1. open', '2. high', '3. low', '4. close', '5. volume']
+
+# Shared HTTP session: keeps the connection alive between stocks (no new TLS
+# handshake per request) and retries rate-limit/server errors with backoff
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    max_retries=Retry(total=3, status_forcelist=[429, 500, 502, 503, 504], backoff_factor=0.5)
+))
+
 
 def fetch_stock_history(symbol):
     """
@@ -46,7 +58,7 @@ def fetch_stock_history(symbol):
     }
 
     try:
-        response = requests.get(BASE_URL, params=params, timeout=15)
+        response = SESSION.get(BASE_URL, params=params, timeout=15)
         response.raise_for_status()
         data = response.json()
 
@@ -65,13 +77,14 @@ def fetch_stock_history(symbol):
         return None
 
 
-def parse_stock_data(data, symbol):
+def parse_stock_data(data, symbol, stock_id=None):
     """
     Parse Alpha Vantage API response into list of daily records
 
     Args:
         data: JSON response from Alpha Vantage
         symbol: Stock ticker
+        stock_id: Integer ID of the stock (looked up from symbol if omitted)
 
     Returns:
         list: List of tuples (date, stock_id, open, high, low, close, volume)
@@ -80,12 +93,50 @@ def parse_stock_data(data, symbol):
         return []
 
     # Get the integer stock_id for this symbol
-    stock_id = get_stock_id(symbol)
+    if stock_id is None:
+        stock_id = get_stock_id(symbol)
     if stock_id is None:
         print(f"Error: Stock symbol {symbol} not found in database")
         return []
 
     time_series = data['Time Series (Daily)']
+
+    try:
+        # Convert every field of every day in one step
+        dates = [date_string_to_int(date_string) for date_string in time_series]
+        table = np.array(
+            [[values[field] for field in STOCK_FIELDS] for values in time_series.values()],
+            dtype=np.float64
+        ).reshape(-1, len(STOCK_FIELDS))
+    except (KeyError, ValueError):
+        # Some day is malformed; parse row by row so it can be reported and skipped
+        return _parse_stock_rows(time_series, stock_id, symbol)
+
+    n = len(dates)
+    return list(zip(
+        dates,
+        [stock_id] * n,
+        table[:, 0].tolist(),
+        table[:, 1].tolist(),
+        table[:, 2].tolist(),
+        table[:, 3].tolist(),
+        table[:, 4].astype(np.int64).tolist()
+    ))
+
+
+def _parse_stock_rows(time_series, stock_id, symbol):
+    """
+    Parse an Alpha Vantage time series one day at a time
+    Days with missing or invalid fields are reported and skipped
+
+    Args:
+        time_series: 'Time Series (Daily)' dict from Alpha Vantage
+        stock_id: Integer ID of the stock
+        symbol: Stock ticker for logging
+
+    Returns:
+        list: List of tuples (date, stock_id, open, high, low, close, volume)
+    """
     records = []
 
     for date_string, values in time_series.items():
@@ -123,33 +174,52 @@ def insert_stock_data(records, symbol, max_rows=MAX_ROWS_PER_RUN):
     conn = get_db_connection()
     cur = conn.cursor()
 
+    # Take the write lock once: the duplicate lookup and the insert run in
+    # one transaction with a single commit at the end
+    cur.execute("BEGIN IMMEDIATE")
+
     inserted_count = 0
     skipped_count = 0
 
-    for record in records:
-        date, stock_id, open_price, high_price, low_price, close_price, volume = record
-
-        # Check if already exists (avoid duplicates)
-        if check_stock_data_exists(stock_id, date):
-            skipped_count += 1
-            continue
+    try:
+        # Fetch every date already stored for these stocks in one query
+        stock_ids = sorted({record[1] for record in records})
+        placeholders = ', '.join('?' * len(stock_ids))
+        cur.execute(f"""
+            SELECT date, stock_id
+            FROM stock_price
+            WHERE stock_id IN ({placeholders})
+        """, stock_ids)
+        existing = {(row['date'], row['stock_id']) for row in cur.fetchall()}
+
+        # Drop duplicates (already stored, or repeated within this batch)
+        new_records = []
+        for record in records:
+            key = (record[0], record[1])
+            if key in existing:
+                continue
+            existing.add(key)
+            new_records.append(record)
+
+        skipped_count = len(records) - len(new_records)
 
         # Check if we've reached the limit for this run
-        if inserted_count >= max_rows:
+        if len(new_records) > max_rows:
             print(f"Reached limit of {max_rows} rows for this run")
-            break
+        new_records = new_records[:max_rows]
 
-        try:
-            cur.execute("""
-                INSERT INTO stock_price (date, stock_id, open, high, low, close, volume)
+        if new_records:
+            cur.executemany("""
+                INSERT OR IGNORE INTO stock_price (date, stock_id, open, high, low, close, volume)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (date, stock_id, open_price, high_price, low_price, close_price, volume))
-            inserted_count += 1
-        except Exception as e:
-            print(f"Error inserting data for {symbol} on {date}: {e}")
+            """, new_records)
+            inserted_count = cur.rowcount
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        inserted_count = 0
+        print(f"Error inserting data for {symbol}: {e}")
 
     print(f"{symbol}: Inserted {inserted_count} rows, Skipped {skipped_count} duplicates")
     return inserted_count
@@ -194,7 +264,7 @@ def collect_stock_data():
             continue
 
         # Parse the data
-        records = parse_stock_data(data, symbol)
+        records = parse_stock_data(data, symbol, stock_id)
         print(f"  Retrieved {len(records)} records from API")
 
         if not records:
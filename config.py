@@ -33,3 +33,4 @@ STOCK_SYMBOLS = ['NVDA', 'AMD', 'COIN']
 OUTPUT_DIR = "output"
 VISUALIZATIONS_DIR = f"{OUTPUT_DIR}/visualizations"
 RESULTS_FILE = f"{OUTPUT_DIR}/analysis_results.txt"
+ANALYSIS_CACHE_FILE = f"{OUTPUT_DIR}/analysis_cache.pkl"
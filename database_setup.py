@@ -3,12 +3,22 @@ Database Setup Module
 Creates and manages SQLite database for cryptocurrency and stock analysis
 """
 
+import atexit
 import sqlite3
 import os
+import threading
 from config import DATABASE_NAME, CRYPTO_SYMBOLS
 
 DB_NAME = DATABASE_NAME
 
+# Shared connection, opened on first use by get_db_connection()
+_connection = None
+_connection_lock = threading.Lock()
+
+# Symbol -> ID caches; only found IDs are stored since IDs never change
+_CRYPTO_ID_CACHE: dict[str, int] = {}
+_STOCK_ID_CACHE: dict[str, int] = {}
+
 
 def date_string_to_int(date_string):
     """
@@ -48,14 +58,81 @@ def date_int_to_string(date_int):
 
 def get_db_connection():
     """
-    Create and return a database connection
+    Return the shared database connection, opening it on first use
+    Every helper reuses this one connection, so callers must not close it
 
     Returns:
         sqlite3.Connection: Database connection object
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # Access columns by name
-    return conn
+    global _connection
+
+    with _connection_lock:
+        if _connection is None:
+            conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+            conn.row_factory = sqlite3.Row  # Access columns by name
+
+            # Write-ahead logging: readers don't block the writer and
+            # commits don't need a full fsync of the database file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+
+            # 64 MB page cache and memory-mapped reads for the analysis scans
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("PRAGMA mmap_size=268435456")
+
+            # Databases created before the indexes existed get them here
+            create_indexes(conn)
+
+            _connection = conn
+
+    return _connection
+
+
+def close_db_connection():
+    """
+    Close the shared database connection
+    The next get_db_connection() call opens a fresh one
+    Runs automatically when the program exits
+    """
+    global _connection
+
+    with _connection_lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+
+
+atexit.register(close_db_connection)
+
+
+def create_indexes(conn):
+    """
+    Create the per-symbol (id, date) indexes on the price tables
+    The primary keys lead with date, so per-symbol lookups such as
+    MAX(date) WHERE crypto_id = ? and symbol-then-date scans need these
+    Safe to run repeatedly; tables that don't exist yet are skipped
+
+    Args:
+        conn: Database connection
+    """
+    cur = conn.cursor()
+
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {row['name'] for row in cur.fetchall()}
+
+    if 'crypto_price' in tables:
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_crypto_price_id_date
+            ON crypto_price (crypto_id, date DESC)
+        """)
+    if 'stock_price' in tables:
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stock_price_id_date
+            ON stock_price (stock_id, date DESC)
+        """)
+
+    conn.commit()
 
 
 def create_tables():
@@ -117,7 +194,7 @@ def create_tables():
     """)
 
     conn.commit()
-    conn.close()
+    create_indexes(conn)
     print("Database tables created successfully!")
 
 
@@ -133,31 +210,38 @@ def insert_crypto_symbol(symbol, name):
     Returns:
         int: The crypto_id for this symbol
     """
+    # Known symbols need no database work at all
+    if symbol in _CRYPTO_ID_CACHE:
+        return _CRYPTO_ID_CACHE[symbol]
+
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # Check if symbol already exists
-    cur.execute("SELECT id FROM crypto_symbol WHERE symbol = ?", (symbol,))
+    # Insert only if the symbol is missing: an upsert would advance the
+    # AUTOINCREMENT counter even when the symbol already exists
+    cur.execute("""
+        INSERT INTO crypto_symbol (symbol, name)
+        SELECT ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM crypto_symbol WHERE symbol = ?)
+        RETURNING id
+    """, (symbol, name, symbol))
     result = cur.fetchone()
+    conn.commit()
 
-    if result:
-        crypto_id = result['id']
-    else:
-        # Insert new symbol
-        cur.execute("""
-            INSERT INTO crypto_symbol (symbol, name)
-            VALUES (?, ?)
-        """, (symbol, name))
-        conn.commit()
-        crypto_id = cur.lastrowid
+    if result is None:
+        cur.execute("SELECT id FROM crypto_symbol WHERE symbol = ?", (symbol,))
+        result = cur.fetchone()
+    crypto_id = result['id']
+
+    _CRYPTO_ID_CACHE[symbol] = crypto_id
 
-    conn.close()
     return crypto_id
 
 
 def get_crypto_id(symbol):
     """
     Get the integer ID for a crypto symbol
+    Symbol IDs never change once created, so lookups are cached
 
     Args:
         symbol: Crypto ticker (e.g., 'BTC')
@@ -165,15 +249,17 @@ def get_crypto_id(symbol):
     Returns:
         int: The crypto_id, or None if not found
     """
+    if symbol in _CRYPTO_ID_CACHE:
+        return _CRYPTO_ID_CACHE[symbol]
+
     conn = get_db_connection()
     cur = conn.cursor()
 
     cur.execute("SELECT id FROM crypto_symbol WHERE symbol = ?", (symbol,))
     result = cur.fetchone()
 
-    conn.close()
-
     if result:
+        _CRYPTO_ID_CACHE[symbol] = result['id']
         return result['id']
     return None
 
@@ -198,7 +284,6 @@ def get_last_crypto_date(crypto_id):
     """, (crypto_id,))
 
     result = cur.fetchone()
-    conn.close()
 
     return result['last_date'] if result['last_date'] else None
 
@@ -215,31 +300,38 @@ def insert_stock_symbol(symbol, name):
     Returns:
         int: The stock_id for this symbol
     """
+    # Known symbols need no database work at all
+    if symbol in _STOCK_ID_CACHE:
+        return _STOCK_ID_CACHE[symbol]
+
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # Check if symbol already exists
-    cur.execute("SELECT id FROM stock_symbol WHERE symbol = ?", (symbol,))
+    # Insert only if the symbol is missing: an upsert would advance the
+    # AUTOINCREMENT counter even when the symbol already exists
+    cur.execute("""
+        INSERT INTO stock_symbol (symbol, name)
+        SELECT ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM stock_symbol WHERE symbol = ?)
+        RETURNING id
+    """, (symbol, name, symbol))
     result = cur.fetchone()
+    conn.commit()
 
-    if result:
-        stock_id = result['id']
-    else:
-        # Insert new symbol
-        cur.execute("""
-            INSERT INTO stock_symbol (symbol, name)
-            VALUES (?, ?)
-        """, (symbol, name))
-        conn.commit()
-        stock_id = cur.lastrowid
+    if result is None:
+        cur.execute("SELECT id FROM stock_symbol WHERE symbol = ?", (symbol,))
+        result = cur.fetchone()
+    stock_id = result['id']
+
+    _STOCK_ID_CACHE[symbol] = stock_id
 
-    conn.close()
     return stock_id
 
 
 def get_stock_id(symbol):
     """
     Get the integer ID for a stock symbol
+    Symbol IDs never change once created, so lookups are cached
 
     Args:
         symbol: Stock ticker (e.g., 'NVDA')
@@ -247,15 +339,17 @@ def get_stock_id(symbol):
     Returns:
         int: The stock_id, or None if not found
     """
+    if symbol in _STOCK_ID_CACHE:
+        return _STOCK_ID_CACHE[symbol]
+
     conn = get_db_connection()
     cur = conn.cursor()
 
     cur.execute("SELECT id FROM stock_symbol WHERE symbol = ?", (symbol,))
     result = cur.fetchone()
 
-    conn.close()
-
     if result:
+        _STOCK_ID_CACHE[symbol] = result['id']
         return result['id']
     return None
 
@@ -280,7 +374,6 @@ def get_last_stock_date(stock_id):
     """, (stock_id,))
 
     result = cur.fetchone()
-    conn.close()
 
     return result['last_date'] if result['last_date'] else None
 
@@ -305,7 +398,6 @@ def get_crypto_row_count(crypto_id):
     """, (crypto_id,))
 
     result = cur.fetchone()
-    conn.close()
 
     return result['count']
 
@@ -330,11 +422,50 @@ def get_stock_row_count(stock_id):
     """, (stock_id,))
 
     result = cur.fetchone()
-    conn.close()
 
     return result['count']
 
 
+def get_crypto_row_counts():
+    """
+    Count rows for every cryptocurrency in a single query
+
+    Returns:
+        dict: Mapping of crypto symbol -> number of price rows
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT cs.symbol, COUNT(cp.date) as count
+        FROM crypto_symbol cs
+        LEFT JOIN crypto_price cp ON cp.crypto_id = cs.id
+        GROUP BY cs.id
+    """)
+
+    return {row['symbol']: row['count'] for row in cur.fetchall()}
+
+
+def get_stock_row_counts():
+    """
+    Count rows for every stock in a single query
+
+    Returns:
+        dict: Mapping of stock symbol -> number of price rows
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT ss.symbol, COUNT(sp.date) as count
+        FROM stock_symbol ss
+        LEFT JOIN stock_price sp ON sp.stock_id = ss.id
+        GROUP BY ss.id
+    """)
+
+    return {row['symbol']: row['count'] for row in cur.fetchall()}
+
+
 def check_crypto_data_exists(crypto_id, date):
     """
     Check if data already exists for a specific crypto and date
@@ -350,15 +481,14 @@ def check_crypto_data_exists(crypto_id, date):
     cur = conn.cursor()
 
     cur.execute("""
-        SELECT 1
-        FROM crypto_price
-        WHERE crypto_id = ? AND date = ?
+        SELECT EXISTS (
+            SELECT 1
+            FROM crypto_price
+            WHERE crypto_id = ? AND date = ?
+        )
     """, (crypto_id, date))
 
-    result = cur.fetchone()
-    conn.close()
-
-    return result is not None
+    return bool(cur.fetchone()[0])
 
 
 def check_stock_data_exists(stock_id, date):
@@ -376,15 +506,44 @@ def check_stock_data_exists(stock_id, date):
     cur = conn.cursor()
 
     cur.execute("""
-        SELECT 1
-        FROM stock_price
-        WHERE stock_id = ? AND date = ?
+        SELECT EXISTS (
+            SELECT 1
+            FROM stock_price
+            WHERE stock_id = ? AND date = ?
+        )
     """, (stock_id, date))
 
-    result = cur.fetchone()
-    conn.close()
+    return bool(cur.fetchone()[0])
+
 
-    return result is not None
+def bulk_insert_symbols(conn, table, rows):
+    """
+    Insert many symbols into a lookup table in a single transaction
+    Symbols that already exist are left untouched
+
+    Args:
+        conn: Database connection
+        table: Lookup table name ('crypto_symbol' or 'stock_symbol')
+        rows: Iterable of (symbol, name) tuples
+
+    Returns:
+        dict: Mapping of symbol -> integer ID for every row in the table
+    """
+    # Skip existing symbols up front: INSERT OR IGNORE would still advance the
+    # AUTOINCREMENT counter on every ignored row and leave gaps in the IDs
+    with conn:
+        conn.executemany(
+            f"""
+            INSERT INTO {table} (symbol, name)
+            SELECT ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE symbol = ?)
+            """,
+            ((symbol, name, symbol) for symbol, name in rows)
+        )
+
+    cur = conn.cursor()
+    cur.execute(f"SELECT symbol, id FROM {table}")
+    return {row['symbol']: row['id'] for row in cur.fetchall()}
 
 
 def initialize_database():
@@ -392,14 +551,24 @@ def initialize_database():
     Initialize the database with tables and both crypto and stock symbols
     Call this once at the start of the project
     """
+    # Forget the connection and IDs from any earlier database before
+    # re-creating it (its file may have been deleted since it was opened)
+    close_db_connection()
+    _CRYPTO_ID_CACHE.clear()
+    _STOCK_ID_CACHE.clear()
+
     create_tables()
+    conn = get_db_connection()
 
     # Insert cryptocurrency symbols (creates integer keys)
     print("Initializing cryptocurrency symbols...")
+    crypto_ids = bulk_insert_symbols(
+        conn, 'crypto_symbol',
+        [(symbol, info['name']) for symbol, info in CRYPTO_SYMBOLS.items()]
+    )
+    _CRYPTO_ID_CACHE.update(crypto_ids)
     for symbol, info in CRYPTO_SYMBOLS.items():
-        name = info['name']
-        crypto_id = insert_crypto_symbol(symbol, name)
-        print(f"  {name} ({symbol}) with ID: {crypto_id}")
+        print(f"  {info['name']} ({symbol}) with ID: {crypto_ids[symbol]}")
 
     # Insert stock symbols (creates integer keys)
     print("\nInitializing stock symbols...")
@@ -408,9 +577,10 @@ def initialize_database():
         'AMD': 'Advanced Micro Devices',
         'COIN': 'Coinbase Global Inc'
     }
+    stock_ids = bulk_insert_symbols(conn, 'stock_symbol', stock_configs.items())
+    _STOCK_ID_CACHE.update(stock_ids)
     for symbol, name in stock_configs.items():
-        stock_id = insert_stock_symbol(symbol, name)
-        print(f"  {name} ({symbol}) with ID: {stock_id}")
+        print(f"  {name} ({symbol}) with ID: {stock_ids[symbol]}")
 
 
 if __name__ == "__main__":
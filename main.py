@@ -8,6 +8,45 @@ This script provides an interactive menu to run all project components.
 import os
 import sys
 
+from config import CRYPTO_SYMBOLS, STOCK_SYMBOLS
+from database_setup import (
+    initialize_database as init_db,
+    get_crypto_row_counts,
+    get_stock_row_counts,
+    get_db_connection
+)
+from collect_crypto_data import collect_crypto_data as collect_crypto
+from collect_stock_data import collect_stock_data as collect_stock
+from analyze_data import perform_analysis, write_results_to_file
+from visualize_data import create_all_visualizations
+
+# Set by enable_ansi_escapes(); False means fall back to the 'cls' command
+ANSI_ENABLED = os.name != 'nt'
+
+def enable_ansi_escapes():
+    """Turn on ANSI escape handling in the Windows console"""
+    global ANSI_ENABLED
+    if os.name != 'nt':
+        return
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_uint32()
+        if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            # 0x0004 = ENABLE_VIRTUAL_TERMINAL_PROCESSING
+            ANSI_ENABLED = bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))
+    except Exception:
+        ANSI_ENABLED = False
+
+def clear_screen():
+    """Clear the terminal without spawning a shell"""
+    if ANSI_ENABLED:
+        sys.stdout.write("\x1b[2J\x1b[H")
+        sys.stdout.flush()
+    else:
+        os.system('cls')
+
 def print_header(title):
     """Print a formatted header"""
     print("\n" + "=" * 70)
@@ -36,7 +75,6 @@ def print_menu():
 def initialize_database():
     """Initialize the database"""
     print_header("Step 1: Initialize Database")
-    from database_setup import initialize_database as init_db
     init_db()
     print("\nDatabase initialized successfully!")
     input("\nPress Enter to continue...")
@@ -46,8 +84,7 @@ def collect_crypto_data():
     print_header("Step 2: Collect Cryptocurrency Data")
     print("This will fetch data from CoinGecko API (max 25 rows per run)")
     print("Run this script 4-5 times to get 100+ rows per cryptocurrency\n")
-    from collect_crypto_data import collect_crypto_data as collect
-    collect()
+    collect_crypto()
     input("\nPress Enter to continue...")
 
 def collect_stock_data():
@@ -56,22 +93,22 @@ def collect_stock_data():
     print("This will fetch data from Alpha Vantage API (max 25 rows per run)")
     print("Run this script 4-5 times to get 100+ rows per stock")
     print("Note: This may take 30-40 seconds due to API rate limits\n")
-    from collect_stock_data import collect_stock_data as collect
-    collect()
+    collect_stock()
     input("\nPress Enter to continue...")
 
 def check_progress():
     """Check data collection progress"""
     print_header("Data Collection Progress")
-    from database_setup import get_crypto_row_count, get_crypto_id, get_stock_row_count, get_stock_id
-    from config import CRYPTO_SYMBOLS, STOCK_SYMBOLS
+
+    # One grouped query per table instead of lookups per symbol
+    crypto_counts = get_crypto_row_counts()
+    stock_counts = get_stock_row_counts()
 
     print("CRYPTOCURRENCY DATA:")
     total_crypto = 0
     for symbol in CRYPTO_SYMBOLS.keys():
-        crypto_id = get_crypto_id(symbol)
-        if crypto_id:
-            count = get_crypto_row_count(crypto_id)
+        if symbol in crypto_counts:
+            count = crypto_counts[symbol]
             total_crypto += count
             status = "✓ DONE" if count >= 100 else f"Need {100 - count} more"
             print(f"  {symbol}: {count:4d} rows  [{status}]")
@@ -81,9 +118,8 @@ def check_progress():
     print("\nSTOCK DATA:")
     total_stock = 0
     for symbol in STOCK_SYMBOLS:
-        stock_id = get_stock_id(symbol)
-        if stock_id:
-            count = get_stock_row_count(stock_id)
+        if symbol in stock_counts:
+            count = stock_counts[symbol]
             total_stock += count
             status = "✓ DONE" if count >= 100 else f"Need {100 - count} more"
             print(f"  {symbol}: {count:4d} rows  [{status}]")
@@ -94,8 +130,8 @@ def check_progress():
     print("\nRequirement: 100+ rows for EACH cryptocurrency and stock")
 
     # Check if all meet requirements
-    crypto_ready = all(get_crypto_row_count(get_crypto_id(s)) >= 100 for s in CRYPTO_SYMBOLS.keys() if get_crypto_id(s))
-    stock_ready = all(get_stock_row_count(get_stock_id(s)) >= 100 for s in STOCK_SYMBOLS if get_stock_id(s))
+    crypto_ready = all(crypto_counts[s] >= 100 for s in CRYPTO_SYMBOLS.keys() if s in crypto_counts)
+    stock_ready = all(stock_counts[s] >= 100 for s in STOCK_SYMBOLS if s in stock_counts)
 
     if crypto_ready and stock_ready:
         print("\n✓ ALL DATA COLLECTION COMPLETE! Ready for analysis.")
@@ -111,7 +147,6 @@ def run_analysis():
     print_header("Step 5: Run Analysis")
     print("Analyzing data from database...")
     print("This will create: output/analysis_results.txt\n")
-    from analyze_data import perform_analysis, write_results_to_file
     results = perform_analysis()
 
     if results:
@@ -130,7 +165,6 @@ def create_visualizations():
     print("This will create:")
     print("  - output/visualizations/price_movement_chart.png")
     print("  - output/visualizations/correlation_heatmap.png\n")
-    from visualize_data import create_all_visualizations
     create_all_visualizations()
     print("\n✓ Visualizations created successfully!")
     input("\nPress Enter to continue...")
@@ -156,15 +190,13 @@ def run_everything():
     print("\nCollecting cryptocurrency data (5 runs)...")
     for i in range(5):
         print(f"\n--- Crypto Collection Run {i+1}/5 ---")
-        from collect_crypto_data import collect_crypto_data
-        collect_crypto_data()
+        collect_crypto()
 
     # Collect stock data 5 times
     print("\nCollecting stock data (5 runs)...")
     for i in range(5):
         print(f"\n--- Stock Collection Run {i+1}/5 ---")
-        from collect_stock_data import collect_stock_data
-        collect_stock_data()
+        collect_stock()
 
     # Check progress
     print("\n" + "=" * 70)
@@ -172,14 +204,12 @@ def run_everything():
 
     # Run analysis
     print("\nRunning analysis...")
-    from analyze_data import perform_analysis, write_results_to_file
     results = perform_analysis()
     if results:
         write_results_to_file(results)
 
     # Create visualizations
     print("\nCreating visualizations...")
-    from visualize_data import create_all_visualizations
     create_all_visualizations()
 
     print("\n" + "=" * 70)
@@ -202,8 +232,7 @@ def view_database_summary():
         input("\nPress Enter to continue...")
         return
 
-    import sqlite3
-    conn = sqlite3.connect('crypto_stock_analysis.db')
+    conn = get_db_connection()
     cur = conn.cursor()
 
     # Show tables
@@ -222,14 +251,15 @@ def view_database_summary():
 
     # Show row counts
     print("\nROW COUNTS:")
-    cur.execute("SELECT COUNT(*) FROM crypto_symbol")
-    print(f"  crypto_symbol: {cur.fetchone()[0]} rows")
-
-    cur.execute("SELECT COUNT(*) FROM crypto_price")
-    print(f"  crypto_price:  {cur.fetchone()[0]} rows")
-
-    cur.execute("SELECT COUNT(*) FROM stock_price")
-    print(f"  stock_price:   {cur.fetchone()[0]} rows")
+    cur.execute("""
+        SELECT 'crypto_symbol', COUNT(*) FROM crypto_symbol
+        UNION ALL
+        SELECT 'crypto_price', COUNT(*) FROM crypto_price
+        UNION ALL
+        SELECT 'stock_price', COUNT(*) FROM stock_price
+    """)
+    for table_name, count in cur.fetchall():
+        print(f"  {table_name + ':':<14} {count} rows")
 
     # Show sample data
     print("\nSAMPLE CRYPTO_PRICE DATA (with JOIN):")
@@ -242,23 +272,24 @@ def view_database_summary():
     for row in cur.fetchall():
         print(f"  {row[0]}: ${row[2]:.2f} on {row[1]}")
 
-    print("\nSAMPLE STOCK_PRICE DATA:")
+    print("\nSAMPLE STOCK_PRICE DATA (with JOIN):")
     cur.execute("""
-        SELECT symbol, date, close
-        FROM stock_price
+        SELECT ss.symbol, sp.date, sp.close
+        FROM stock_price sp
+        JOIN stock_symbol ss ON sp.stock_id = ss.id
         LIMIT 5
     """)
     for row in cur.fetchall():
         print(f"  {row[0]}: ${row[2]:.2f} on {row[1]}")
 
-    conn.close()
     input("\nPress Enter to continue...")
 
 def main():
     """Main program loop"""
+    enable_ansi_escapes()
     while True:
         try:
-            os.system('clear' if os.name != 'nt' else 'cls')  # Clear screen
+            clear_screen()
             print_menu()
             choice = input("Enter your choice: ")
 
@@ -1,17 +1,93 @@
 """
 Data Visualization Module
 Creates visualizations from calculated data
-Requires: matplotlib and seaborn
+Requires: matplotlib, seaborn and pandas
 """
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+import os
+import sys
 from analyze_data import perform_analysis
-from database_setup import get_db_connection, date_int_to_string
+from database_setup import get_db_connection
 from config import VISUALIZATIONS_DIR
 import numpy as np
-import os
-from datetime import datetime
+
+# Without a display there is nowhere to show a window, so render off-screen
+HEADLESS = (os.name == 'posix' and sys.platform != 'darwin' and
+            not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'))
+
+# Set SHOW_PLOTS=0 to only save the charts (default: show unless headless)
+SHOW_PLOTS = os.environ.get('SHOW_PLOTS', '0' if HEADLESS else '1') != '0'
+
+# A 14in-wide chart at 300 dpi is about 4200 pixels across; more points per
+# line than that can't be seen and only slow down rendering
+MAX_PLOT_POINTS = 4096
+
+# Fastest zlib level for the 300 dpi PNGs: quicker saves, somewhat larger files
+PNG_SAVE_OPTIONS = {'compress_level': 1}
+
+
+def downsample_series(dates, values, max_points=MAX_PLOT_POINTS):
+    """
+    Thin a series to at most max_points (+1) evenly strided points
+    The last point is always kept so lines still end on the latest date
+
+    Args:
+        dates: Array of dates
+        values: Array of values (same length as dates)
+        max_points: Target number of points
+
+    Returns:
+        tuple: (dates, values) arrays, unchanged if already short enough
+    """
+    step = -(-len(values) // max_points)  # Ceiling division
+    if step <= 1:
+        return dates, values
+
+    keep = np.arange(0, len(values), step)
+    if keep[-1] != len(values) - 1:
+        keep = np.append(keep, len(values) - 1)
+    return dates[keep], values[keep]
+
+
+def load_plotting_libraries():
+    """
+    Import matplotlib and seaborn on first use
+    Keeps importing this module cheap for callers that only need the data
+
+    Returns:
+        tuple: (matplotlib.pyplot, seaborn)
+    """
+    import matplotlib
+    if (HEADLESS and not os.environ.get('MPLBACKEND') and
+            'matplotlib.pyplot' not in sys.modules):
+        matplotlib.use('Agg')
+
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+
+def read_query_frame(conn, query):
+    """
+    Run a query and load its rows into a DataFrame
+    Rows come back as plain tuples instead of sqlite3.Row objects
+
+    Args:
+        conn: Database connection
+        query: SQL query to run
+
+    Returns:
+        DataFrame: Query results with the query's column names
+    """
+    # Imported here so loading this module doesn't pay for pandas up front
+    import pandas as pd
+
+    cur = conn.cursor()
+    cur.row_factory = None  # Plain tuples, no per-column name lookups
+    cur.execute(query)
+    columns = [description[0] for description in cur.description]
+
+    return pd.DataFrame.from_records(cur.fetchall(), columns=columns)
 
 
 def get_normalized_prices():
@@ -20,77 +96,106 @@ def get_normalized_prices():
     Uses JOIN to get crypto symbol names
 
     Returns:
-        tuple: (crypto_normalized, stock_normalized, dates)
+        tuple: (crypto_normalized, stock_normalized), each a dict of
+               symbol -> (dates array, normalized values array)
     """
     conn = get_db_connection()
-    cur = conn.cursor()
 
-    # Get crypto prices with JOIN
-    crypto_query = """
+    # Get crypto and stock prices with JOINs in one query, each normalized
+    # against its symbol's first price; kind tells the two halves apart
+    price_query = """
         SELECT
+            'crypto' AS kind,
             cp.date,
             cs.symbol,
-            cp.price_usd
+            cp.price_usd * 100.0 / FIRST_VALUE(cp.price_usd) OVER (
+                PARTITION BY cs.symbol ORDER BY cp.date
+            ) AS norm
         FROM crypto_price cp
         JOIN crypto_symbol cs ON cp.crypto_id = cs.id
-        ORDER BY cs.symbol, cp.date
-    """
-
-    cur.execute(crypto_query)
-    crypto_rows = cur.fetchall()
-
-    # Get stock prices with JOIN
-    stock_query = """
-        SELECT sp.date, ss.symbol, sp.close
+        UNION ALL
+        SELECT
+            'stock' AS kind,
+            sp.date,
+            ss.symbol,
+            sp.close * 100.0 / FIRST_VALUE(sp.close) OVER (
+                PARTITION BY ss.symbol ORDER BY sp.date
+            ) AS norm
         FROM stock_price sp
         JOIN stock_symbol ss ON sp.stock_id = ss.id
-        ORDER BY ss.symbol, sp.date
+        ORDER BY kind, symbol, date
     """
 
-    cur.execute(stock_query)
-    stock_rows = cur.fetchall()
-
-    conn.close()
-
-    # Organize by symbol
-    crypto_by_symbol = {}
-    for row in crypto_rows:
-        symbol = row['symbol']
-        if symbol not in crypto_by_symbol:
-            crypto_by_symbol[symbol] = []
-        crypto_by_symbol[symbol].append((row['date'], row['price_usd']))
-
-    stock_by_symbol = {}
-    for row in stock_rows:
-        symbol = row['symbol']
-        if symbol not in stock_by_symbol:
-            stock_by_symbol[symbol] = []
-        stock_by_symbol[symbol].append((row['date'], row['close']))
-
-    # Normalize to 100
-    crypto_normalized = {}
-    for symbol, data in crypto_by_symbol.items():
-        if data:
-            first_price = data[0][1]
-            normalized = [(date, (price / first_price) * 100) for date, price in data]
-            crypto_normalized[symbol] = normalized
-
-    stock_normalized = {}
-    for symbol, data in stock_by_symbol.items():
-        if data:
-            first_price = data[0][1]
-            normalized = [(date, (price / first_price) * 100) for date, price in data]
-            stock_normalized[symbol] = normalized
+    price_df = read_query_frame(conn, price_query)
+
+    # Split into per-symbol (dates, values) arrays for each kind, gathering
+    # straight from the column arrays by each group's row positions
+    dates = price_df['date'].to_numpy()
+    values = price_df['norm'].to_numpy()
+    normalized = {'crypto': {}, 'stock': {}}
+    groups = price_df.groupby(['kind', 'symbol'], sort=False).indices
+    for (kind, symbol), positions in groups.items():
+        normalized[kind][symbol] = (dates[positions], values[positions])
+    crypto_normalized = normalized['crypto']
+    stock_normalized = normalized['stock']
 
     return crypto_normalized, stock_normalized
 
 
-def create_price_movement_chart():
+def new_or_reused_figure(plt, fig, size):
+    """
+    Get a figure of the given size to draw a chart into
+
+    Args:
+        plt: matplotlib.pyplot module
+        fig: Figure to reuse (cleared first), or None to create one
+        size: (width, height) in inches
+
+    Returns:
+        tuple: (figure, True if the figure was created here)
+    """
+    if fig is None:
+        return plt.figure(figsize=size), True
+
+    fig.clear()
+    fig.set_size_inches(size)
+    return fig, False
+
+
+def finish_figure(plt, fig, owns_figure, filepath):
+    """
+    Save a finished chart, then show/close it if it isn't a shared figure
+
+    Args:
+        plt: matplotlib.pyplot module
+        fig: Figure holding the chart
+        owns_figure: True if the chart function created the figure
+        filepath: PNG path to save to
+    """
+    # Create output directory if it doesn't exist
+    os.makedirs(VISUALIZATIONS_DIR, exist_ok=True)
+
+    fig.savefig(filepath, dpi=300, bbox_inches='tight', pil_kwargs=PNG_SAVE_OPTIONS)
+    print(f"  Saved: {filepath}")
+
+    if owns_figure:
+        if SHOW_PLOTS:
+            plt.show()
+        plt.close(fig)
+
+
+def create_price_movement_chart(fig=None):
     """
     Visualization 1: Dual-axis line chart showing normalized price movements
     Cryptocurrencies on left axis, stocks on right axis
+
+    Args:
+        fig: Figure to draw into (cleared first); a new one is made if None
     """
     print("Creating Visualization 1: Price Movement Chart...")
+    plt, _ = load_plotting_libraries()
+    import matplotlib.dates as mdates
+    import pandas as pd
 
     crypto_normalized, stock_normalized = get_normalized_prices()
 
@@ -99,20 +204,16 @@ def create_price_movement_chart():
         return
 
     # Create figure with dual y-axes
-    fig, ax1 = plt.subplots(figsize=(14, 8))
+    fig, owns_figure = new_or_reused_figure(plt, fig, (14, 8))
+    ax1 = fig.add_subplot()
 
-    # Get all unique dates and convert to datetime for proper plotting
-    all_dates = set()
-    for data in crypto_normalized.values():
-        all_dates.update([d for d, _ in data])
-    for data in stock_normalized.values():
-        all_dates.update([d for d, _ in data])
-
-    # Convert integer dates to datetime objects
-    date_mapping = {}
-    for date_int in sorted(all_dates):
-        date_str = date_int_to_string(date_int)
-        date_mapping[date_int] = datetime.strptime(date_str, '%Y-%m-%d')
+    # Parse each distinct date once; every series then gathers its datetimes
+    # from this sorted table instead of re-parsing its own dates
+    all_dates = np.unique(np.concatenate(
+        [dates for dates, _ in crypto_normalized.values()] +
+        [dates for dates, _ in stock_normalized.values()]
+    ))
+    all_datetimes = pd.to_datetime(all_dates.astype(str), format='%Y%m%d').to_numpy()
 
     # Plot cryptocurrencies on left axis
     ax1.set_xlabel('Date', fontsize=12)
@@ -122,14 +223,16 @@ def create_price_movement_chart():
     crypto_colors = {'BTC': '#f7931a', 'ETH': '#627eea', 'SOL': '#00ffbd'}
     crypto_styles = {'BTC': '-', 'ETH': '--', 'SOL': '-.'}
 
-    for symbol, data in crypto_normalized.items():
+    for symbol, (dates, values) in crypto_normalized.items():
+        dates, values = downsample_series(dates, values)
         # Convert integer dates to datetime objects
-        dates_dt = [date_mapping[d] for d, _ in data]
-        values = [v for _, v in data]
+        dates_dt = all_datetimes[np.searchsorted(all_dates, dates)]
         color = crypto_colors.get(symbol, 'blue')
         style = crypto_styles.get(symbol, '-')
+        # Lines are flattened to pixels; axes and text stay vector
         ax1.plot(dates_dt, values, label=f'{symbol} (Crypto)',
-                linestyle=style, linewidth=2, color=color, alpha=0.8)
+                linestyle=style, linewidth=2, color=color, alpha=0.8,
+                rasterized=True)
 
     # Create second y-axis for stocks
     ax2 = ax1.twinx()
@@ -139,26 +242,26 @@ def create_price_movement_chart():
     stock_colors = {'NVDA': '#76b900', 'AMD': '#ed1c24', 'COIN': '#0052ff'}
     stock_styles = {'NVDA': '-', 'AMD': '--', 'COIN': ':'}
 
-    for symbol, data in stock_normalized.items():
+    for symbol, (dates, values) in stock_normalized.items():
+        dates, values = downsample_series(dates, values)
         # Convert integer dates to datetime objects
-        dates_dt = [date_mapping[d] for d, _ in data]
-        values = [v for _, v in data]
+        dates_dt = all_datetimes[np.searchsorted(all_dates, dates)]
         color = stock_colors.get(symbol, 'red')
         style = stock_styles.get(symbol, '-')
         ax2.plot(dates_dt, values, label=f'{symbol} (Stock)',
-                linestyle=style, linewidth=2, color=color, alpha=0.8)
+                linestyle=style, linewidth=2, color=color, alpha=0.8,
+                rasterized=True)
 
     # Format x-axis to show dates nicely
-    import matplotlib.dates as mdates
     ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
     ax1.xaxis.set_major_locator(mdates.AutoDateLocator())
 
     # Rotate x-axis labels for readability
-    plt.xticks(rotation=45, ha='right')
+    plt.setp(ax1.get_xticklabels(), rotation=45, ha='right')
 
     # Add title and legends
-    plt.title('Cryptocurrency vs Tech Stock Price Movements\n(Normalized to Base 100)',
-              fontsize=14, fontweight='bold', pad=20)
+    ax2.set_title('Cryptocurrency vs Tech Stock Price Movements\n(Normalized to Base 100)',
+                  fontsize=14, fontweight='bold', pad=20)
 
     # Combine legends
     lines1, labels1 = ax1.get_legend_handles_labels()
@@ -169,24 +272,26 @@ def create_price_movement_chart():
     # Add grid for readability
     ax1.grid(True, alpha=0.3)
 
-    plt.tight_layout()
-
-    # Create output directory if it doesn't exist
-    os.makedirs(VISUALIZATIONS_DIR, exist_ok=True)
+    # Fixed margins for this figure size (what tight_layout settles on with
+    # the rotated date labels), so the layout solver doesn't have to measure
+    # every label each run; re-measure if the labels or figure size change
+    fig.subplots_adjust(left=0.06, right=0.94, bottom=0.15, top=0.89)
 
     filepath = os.path.join(VISUALIZATIONS_DIR, 'price_movement_chart.png')
-    plt.savefig(filepath, dpi=300, bbox_inches='tight')
-    print(f"  Saved: {filepath}")
-
-    plt.show()
+    finish_figure(plt, fig, owns_figure, filepath)
 
 
-def create_correlation_heatmap(results):
+def create_correlation_heatmap(results, fig=None):
     """
     Visualization 2: Correlation heatmap showing relationships
     between all cryptocurrencies and stocks
+
+    Args:
+        results: Results dictionary from perform_analysis()
+        fig: Figure to draw into (cleared first); a new one is made if None
     """
     print("Creating Visualization 2: Correlation Heatmap...")
+    plt, sns = load_plotting_libraries()
 
     correlations = results['correlations']
 
@@ -194,33 +299,35 @@ def create_correlation_heatmap(results):
         print("Error: No correlation data available")
         return
 
-    # Extract unique symbols
-    crypto_symbols = set()
-    stock_symbols = set()
-
-    for pair in correlations.keys():
-        crypto, stock = pair.split('-')
-        crypto_symbols.add(crypto)
-        stock_symbols.add(stock)
-
-    crypto_symbols = sorted(crypto_symbols)
-    stock_symbols = sorted(stock_symbols)
-
-    # Create correlation matrix
+    # Extract unique symbols from the (crypto, stock) keys
+    crypto_symbols = sorted({crypto for crypto, _ in correlations})
+    stock_symbols = sorted({stock for _, stock in correlations})
+
+    # Map every pair to its (row, column) cell once
+    crypto_index = {symbol: i for i, symbol in enumerate(crypto_symbols)}
+    stock_index = {symbol: j for j, symbol in enumerate(stock_symbols)}
+    rows = np.fromiter((crypto_index[crypto] for crypto, _ in correlations),
+                       dtype=np.intp, count=len(correlations))
+    cols = np.fromiter((stock_index[stock] for _, stock in correlations),
+                       dtype=np.intp, count=len(correlations))
+    values = np.fromiter(correlations.values(), dtype=np.float64,
+                         count=len(correlations))
+
+    # Create correlation matrix in one scatter (missing pairs count as 0)
     matrix = np.zeros((len(crypto_symbols), len(stock_symbols)))
+    matrix[rows, cols] = values
 
-    for i, crypto in enumerate(crypto_symbols):
-        for j, stock in enumerate(stock_symbols):
-            pair = f"{crypto}-{stock}"
-            matrix[i, j] = correlations.get(pair, 0)
+    # Format every cell label to 3 decimal places in one vectorized pass
+    labels = np.char.mod('%.3f', matrix)
 
     # Create heatmap
-    plt.figure(figsize=(10, 8))
+    fig, owns_figure = new_or_reused_figure(plt, fig, (10, 8))
+    ax = fig.add_subplot()
 
     # Use custom colormap: red for negative, white for zero, green for positive
     sns.heatmap(matrix,
-                annot=True,  # Show correlation values
-                fmt='.3f',   # Format to 3 decimal places
+                annot=labels,  # Show correlation values
+                fmt='',        # Labels are already formatted
                 cmap='RdYlGn',  # Red-Yellow-Green colormap
                 center=0,    # Center colormap at zero
                 vmin=-1,     # Min correlation value
@@ -229,29 +336,24 @@ def create_correlation_heatmap(results):
                 yticklabels=crypto_symbols,
                 cbar_kws={'label': 'Correlation Coefficient'},
                 linewidths=0.5,
-                linecolor='gray')
+                linecolor='gray',
+                ax=ax)
 
-    plt.title('Cross-Market Correlation Heatmap\n' +
-              'Cryptocurrency Daily Returns vs Tech Stock Daily Returns',
-              fontsize=14, fontweight='bold', pad=20)
+    ax.set_title('Cross-Market Correlation Heatmap\n' +
+                 'Cryptocurrency Daily Returns vs Tech Stock Daily Returns',
+                 fontsize=14, fontweight='bold', pad=20)
 
-    plt.xlabel('Stock Symbols', fontsize=12, fontweight='bold')
-    plt.ylabel('Cryptocurrency Symbols', fontsize=12, fontweight='bold')
+    ax.set_xlabel('Stock Symbols', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Cryptocurrency Symbols', fontsize=12, fontweight='bold')
 
     # Rotate labels for better readability
-    plt.xticks(rotation=0, fontsize=11)
-    plt.yticks(rotation=0, fontsize=11)
-
-    plt.tight_layout()
+    plt.setp(ax.get_xticklabels(), rotation=0, fontsize=11)
+    plt.setp(ax.get_yticklabels(), rotation=0, fontsize=11)
 
-    # Create output directory if it doesn't exist
-    os.makedirs(VISUALIZATIONS_DIR, exist_ok=True)
+    fig.tight_layout()
 
     filepath = os.path.join(VISUALIZATIONS_DIR, 'correlation_heatmap.png')
-    plt.savefig(filepath, dpi=300, bbox_inches='tight')
-    print(f"  Saved: {filepath}")
-
-    plt.show()
+    finish_figure(plt, fig, owns_figure, filepath)
 
 
 def create_all_visualizations():
@@ -264,8 +366,7 @@ def create_all_visualizations():
 
     # Check if matplotlib and seaborn are available
     try:
-        import matplotlib
-        import seaborn
+        plt, _ = load_plotting_libraries()
         print("\nRequired libraries found: matplotlib, seaborn")
     except ImportError as e:
         print(f"\nError: Missing required library: {e}")
@@ -283,9 +384,12 @@ def create_all_visualizations():
 
     print("\n" + "-" * 60)
 
+    # When charts are only saved, draw both into one figure and close it once
+    shared_fig = None if SHOW_PLOTS else plt.figure()
+
     # Create visualization 1
     try:
-        create_price_movement_chart()
+        create_price_movement_chart(shared_fig)
     except Exception as e:
         print(f"Error creating price movement chart: {e}")
 
@@ -293,10 +397,13 @@ def create_all_visualizations():
 
     # Create visualization 2
     try:
-        create_correlation_heatmap(results)
+        create_correlation_heatmap(results, shared_fig)
     except Exception as e:
         print(f"Error creating correlation heatmap: {e}")
 
+    if shared_fig is not None:
+        plt.close(shared_fig)
+
     print("\n" + "=" * 60)
     print("Visualization creation complete!")
     print("=" * 60)